@@ -13,20 +13,20 @@ train CNNs.
 """
 
 # Imports
+import os
 import numbers
-import itertools
 import numpy as np
 import torch
-from surfify.utils import (
-    neighbors, rotate_data, find_neighbors, find_rotation_interpol_coefs)
-from surfify.nn import IcoDiNeConv
-from surfify.utils.io import compute_and_store
+from scipy import sparse
+from joblib import Memory
+from surfify.utils import neighbors, find_rotation_interpol_coefs
 from .utils import RandomAugmentation
 
 
 class SurfCutOut(RandomAugmentation):
     """ Starting from random vertices, the SurfCutOut sets an adaptive connex
-    neighborhood to zero.
+    neighborhood to zero. When applied on a batch of tensors, different
+    patches are drawn for each sample.
 
     See Also
     --------
@@ -65,37 +65,133 @@ class SurfCutOut(RandomAugmentation):
             self.neighs = neighbors(vertices, triangles, direct_neighbor=True)
         else:
             self.neighs = neighs
+        neigh_lists = [self.neighs[idx] for idx in range(len(vertices))]
+        self.neighs_pad = np.full(
+            (len(vertices), max(len(item) for item in neigh_lists)), -1,
+            dtype=np.int32)
+        for idx, item in enumerate(neigh_lists):
+            self.neighs_pad[idx, :len(item)] = item
         self.patch_size = patch_size
         self.n_patches = n_patches
         self.sigma = sigma
         self.replacement_value = replacement_value
+        self._neighs_tensor = None
+        self._pool_size = 4096
+        self._seeds = None
+        self._sizes = None
+        self._pos = 0
+        self._pool_pid = None
 
     def run(self, data):
         """ Applies the cut out (ablation) augmentation to the data.
 
         Parameters
         ----------
-        data: array (N, )
+        data: array (N, ) or tensor (N, ), (B, N) or (B, C, N)
             input data/texture.
 
         Returns
         -------
-        data: arr (N, )
+        data: arr (N, ) or tensor (N, ), (B, N) or (B, C, N)
             ablated input data.
         """
-        for idx in range(self.n_patches):
-            random_node = np.random.randint(0, len(self.vertices))
-            random_size = np.random.randint(self.patch_size - self.sigma,
-                                            self.patch_size + self.sigma + 1)
-            patch_indices = find_neighbors(
-                random_node, random_size, self.neighs)
-            data[patch_indices] = self.replacement_value
+        if torch.is_tensor(data):
+            n_samples = len(data) if data.ndim > 1 else 1
+            mask = self._patch_mask_tensor(n_samples, data.device)
+            if data.ndim == 1:
+                mask = mask[0]
+            else:
+                mask = mask.view(n_samples, *([1] * (data.ndim - 2)), -1)
+            return data.masked_fill_(mask, self.replacement_value)
+        n_vertices = len(self.vertices)
+        seeds, sizes = self._draw_patches()
+        mask = np.zeros(n_vertices, dtype=bool)
+        mask[seeds] = True
+        patches, frontier = np.arange(self.n_patches), seeds
+        for ring in range(sizes.max(initial=0)):
+            keep = sizes[patches] > ring
+            patches, frontier = patches[keep], frontier[keep]
+            frontier = self.neighs_pad[frontier].ravel()
+            patches = np.repeat(patches, self.neighs_pad.shape[1])
+            valid = frontier >= 0
+            keys = np.unique(patches[valid] * n_vertices + frontier[valid])
+            patches, frontier = np.divmod(keys, n_vertices)
+            mask[frontier] = True
+        data[mask] = self.replacement_value
         return data
 
+    def _draw_patches(self):
+        """ Draw the patches seeds and sizes from pools of random values
+        sampled in bulk. The pools are drawn again in each process, so that
+        data loader workers do not share the patches of their parent.
+
+        Returns
+        -------
+        seeds: array (n_patches, )
+            the patches starting vertices.
+        sizes: array (n_patches, )
+            the patches sizes.
+        """
+        if (self._pool_pid != os.getpid() or
+                self._pos + self.n_patches > len(self._seeds)):
+            pool_size = max(self._pool_size, self.n_patches)
+            self._seeds = np.random.randint(0, len(self.vertices), pool_size)
+            self._sizes = np.random.uniform(size=pool_size)
+            self._pos = 0
+            self._pool_pid = os.getpid()
+        start, self._pos = self._pos, self._pos + self.n_patches
+        seeds = self._seeds[start: self._pos]
+        sizes = self.patch_size - self.sigma + (
+            self._sizes[start: self._pos] * (2 * self.sigma + 1)).astype(int)
+        return seeds, sizes
+
+    def _patch_mask_tensor(self, n_samples, device):
+        """ Generate the ablation masks of a batch on the requested device.
+
+        Parameters
+        ----------
+        n_samples: int
+            the number of samples in the batch.
+        device: torch.device
+            the device where the masks are generated.
+
+        Returns
+        -------
+        mask: tensor (n_samples, N)
+            the ablation masks.
+        """
+        if self._neighs_tensor is None or self._neighs_tensor.device != device:
+            self._neighs_tensor = torch.from_numpy(
+                self.neighs_pad).long().to(device)
+        neighs_pad = self._neighs_tensor
+        n_vertices = len(self.vertices)
+        n_patches = n_samples * self.n_patches
+        seeds = torch.randint(0, n_vertices, (n_patches, ), device=device)
+        sizes = torch.randint(self.patch_size - self.sigma,
+                              self.patch_size + self.sigma + 1,
+                              (n_patches, ), device=device)
+        patches = torch.arange(n_patches, device=device)
+        mask = torch.zeros(n_samples * n_vertices, dtype=torch.bool,
+                           device=device)
+        mask[(patches // self.n_patches) * n_vertices + seeds] = True
+        frontier = seeds
+        max_size = int(sizes.max()) if n_patches > 0 else 0
+        for ring in range(max_size):
+            keep = sizes[patches] > ring
+            patches, frontier = patches[keep], frontier[keep]
+            frontier = neighs_pad.index_select(0, frontier).view(-1)
+            patches = torch.repeat_interleave(patches, neighs_pad.size(1))
+            valid = frontier >= 0
+            keys = torch.unique(patches[valid] * n_vertices + frontier[valid])
+            patches, frontier = keys // n_vertices, keys % n_vertices
+            mask[(patches // self.n_patches) * n_vertices + frontier] = True
+        return mask.view(n_samples, n_vertices)
+
 
 class SurfNoise(RandomAugmentation):
     """ The SurfNoise adds a Gaussian white noise with standard deviation
-    sigma.
+    sigma. When applied on a batch of tensors, the noise is drawn on the data
+    device.
     """
     def __init__(self, sigma):
         """ Init class.
@@ -113,30 +209,36 @@ class SurfNoise(RandomAugmentation):
 
         Parameters
         ----------
-        data: array (N, )
+        data: array (N, ) or tensor (N, ), (B, N) or (B, C, N)
             input data/texture.
 
         Returns
         -------
-        data: arr (N, )
+        data: arr (N, ) or tensor (N, ), (B, N) or (B, C, N)
             noised input data.
         """
-        data += np.random.normal(0, self.sigma, len(data))
+        if torch.is_tensor(data):
+            return data.add_(torch.randn_like(data), alpha=self.sigma)
+        noise = np.random.standard_normal(len(data))
+        noise *= self.sigma
+        data += noise
         return data
 
 
 class SurfBlur(RandomAugmentation):
-    """ An icosahedron texture Gaussian blur implementation. It uses the DiNe
-    convolution filter for speed. The receptive field is controlled by sigma,
-    expressed in mm.
+    """ An icosahedron texture Gaussian blur implementation. The DiNe
+    Gaussian filter is stored as a sparse matrix for speed. The receptive
+    field is controlled by sigma, expressed in mm. When applied on a batch of
+    tensors, the same sigma is used for all samples.
 
     See Also
     --------
     surfify.utils.neighbors
-    surfify.nn.modules.IcoDiNeConv
     """
-    def __init__(self, vertices, triangles, sigma, neighs=None):
+    def __init__(self, vertices, triangles, sigma, neighs=None,
+                 cachedir=None):
         """ Init class.
+
         Parameters
         ----------
         vertices: array (N, 3)
@@ -150,51 +252,124 @@ class SurfBlur(RandomAugmentation):
             with `sufify.utils.neighbors`, ie. a dictionary with vertices row
             index as keys and a dictionary of neighbors vertices row indexes
             organized by rings as values.
+        cachedir: str, default None
+            set this folder to use smart caching speedup.
         """
         super().__init__()
         self.vertices = vertices
         self.triangles = triangles
         self.sigma = sigma
+        self.memory = Memory(cachedir, verbose=0)
         depth = max(1, int(2 * self.sigma + 0.5))
         if neighs is None:
-            self.neighs = neighbors(vertices, triangles, depth=depth,
-                                    direct_neighbor=True)
+            neighbors_cached = self.memory.cache(neighbors)
+            self.neighs = neighbors_cached(
+                vertices, triangles, depth=depth, direct_neighbor=True)
         else:
             self.neighs = neighs
         self.neighs = np.asarray(list(self.neighs.values()))
-        self.positions = np.array([0] + list(itertools.chain(*[
-            [ring] * (6 * ring) for ring in range(1, depth + 1)])))
+        rings = np.arange(1, depth + 1)
+        self.positions = np.concatenate([[0], np.repeat(rings, 6 * rings)])
         assert len(self.positions) == len(self.neighs[0])
-        self.conv = IcoDiNeConv(1, 1, self.neighs, bias=False)
+        n_vertices, n_neighs = self.neighs.shape
+        keys = (np.arange(n_vertices)[:, None] * n_vertices +
+                self.neighs).ravel()
+        keys, first, inverse = np.unique(
+            keys, return_index=True, return_inverse=True)
+        self._blur_indices = keys % n_vertices
+        self._blur_indptr = np.searchsorted(
+            keys // n_vertices, np.arange(n_vertices + 1))
+        duplicates = np.ones(len(inverse), dtype=bool)
+        duplicates[first] = False
+        self._blur_first = first % n_neighs
+        self._blur_duplicates = (
+            inverse[duplicates], np.flatnonzero(duplicates) % n_neighs)
+        self._blur_sigma = None
+        self._operator_sigma = None
+        self.gaussian_kernel = None
+        self.blur_operator = None
+        self._neighs_tensor = None
 
     def run(self, data):
         """ Applies the augmentation to the data.
 
         Parameters
         ----------
-        data: array (N, )
+        data: array (N, ) or tensor (N, ), (B, N) or (B, C, N)
             input data/texture.
 
         Returns
         -------
-        data: array (N, )
+        data: array (N, ) or tensor (N, ), (B, N) or (B, C, N)
             blurred output data.
         """
-        gaussian_kernel = np.exp(-0.5 * (self.positions / self.sigma) ** 2)
-        gaussian_kernel = gaussian_kernel / gaussian_kernel.sum()
-        with torch.no_grad():
-            self.conv.weight.weight = torch.nn.Parameter(
-                torch.Tensor(gaussian_kernel), False)
-        data = self.conv(torch.from_numpy(data[None, None]).float())
-        return data.numpy().squeeze()
+        if self._blur_sigma != self.sigma:
+            gaussian_kernel = np.exp(
+                -0.5 * (self.positions / self.sigma) ** 2)
+            self.gaussian_kernel = gaussian_kernel / gaussian_kernel.sum()
+            self._blur_sigma = self.sigma
+        if torch.is_tensor(data) and data.is_cuda:
+            return self._gather_blur(data)
+        if self._operator_sigma != self.sigma:
+            self._update_blur_operator()
+            self._operator_sigma = self.sigma
+        return self._sparse_dot(self.blur_operator, data)
+
+    def _update_blur_operator(self):
+        """ Update the sparse Gaussian blur operator: its sparsity pattern is
+        computed once, only the operator values are refreshed from the
+        current Gaussian kernel. Repeated neighbors are summed.
+        """
+        values = self.gaussian_kernel[self._blur_first]
+        duplicates, positions = self._blur_duplicates
+        np.add.at(values, duplicates, self.gaussian_kernel[positions])
+        if self.blur_operator is None:
+            n_vertices = len(self.neighs)
+            self.blur_operator = sparse.csr_matrix(
+                (values, self._blur_indices, self._blur_indptr),
+                shape=(n_vertices, n_vertices))
+        else:
+            self.blur_operator.data[:] = values
+
+    def _gather_blur(self, data):
+        """ Applies the blur on GPU tensors: the fixed size neighborhoods
+        are gathered and reduced with the Gaussian kernel in a single matrix
+        product, which is faster than a generic sparse product on GPU for
+        such small kernels (on CPU the sparse product remains faster).
+
+        Parameters
+        ----------
+        data: tensor (..., N)
+            input data/texture.
+
+        Returns
+        -------
+        data: tensor (..., N)
+            blurred output data.
+        """
+        if (self._neighs_tensor is None or
+                self._neighs_tensor.device != data.device):
+            self._neighs_tensor = torch.as_tensor(
+                self.neighs.reshape(-1), dtype=torch.int32,
+                device=data.device)
+        neighs = self._neighs_tensor
+        kernel = torch.as_tensor(self.gaussian_kernel, dtype=data.dtype,
+                                 device=data.device)
+        shape = data.shape
+        data = data.reshape(-1, shape[-1]).T.contiguous()
+        data = data.index_select(0, neighs).view(shape[-1], len(kernel), -1)
+        return torch.matmul(kernel, data).T.reshape(shape)
 
 
 class SurfRotation(RandomAugmentation):
-    """ The SurfRotation rotate the cortical measures.
+    """ The SurfRotation rotate the cortical measures. The interpolation
+    coefficients are stored as a sparse matrix for speed. When applied on a
+    batch of tensors, the same angles are used for all samples.
 
     See Also
     --------
     surfify.utils.rotate_data
+    surfify.utils.find_rotation_interpol_coefs
     """
     def __init__(self, vertices, triangles, phi=5, theta=0, psi=0,
                  interpolation="barycentric", cachedir=None):
@@ -225,8 +400,11 @@ class SurfRotation(RandomAugmentation):
         self.theta = theta
         self.psi = psi
         self.interpolation = interpolation
-        self.rotate_data_cached = compute_and_store(
-            find_rotation_interpol_coefs, cachedir)(rotate_data)
+        self.memory = Memory(cachedir, verbose=0)
+        self.find_interpol_coefs_cached = self.memory.cache(
+            find_rotation_interpol_coefs)
+        self._rotation_angles = None
+        self.rotation_operator = None
 
     def run(self, data):
         """ Rotates the provided vertices and projects the input data
@@ -234,14 +412,39 @@ class SurfRotation(RandomAugmentation):
 
         Parameters
         ----------
-        data: array (N, )
+        data: array (N, ) or tensor (N, ), (B, N) or (B, C, N)
             input data/texture.
 
         Returns
         -------
-        data: arr (N, )
+        data: arr (N, ) or tensor (N, ), (B, N) or (B, C, N)
             rotated input data.
         """
-        return self.rotate_data_cached(
-            data[np.newaxis, :, np.newaxis], self.vertices, self.triangles,
-            [self.phi, self.theta, self.psi], self.interpolation).squeeze()
+        angles = [self.phi, self.theta, self.psi]
+        if self._rotation_angles != angles:
+            self.rotation_operator = self._build_rotation_operator(angles)
+            self._rotation_angles = angles
+        return self._sparse_dot(self.rotation_operator, data)
+
+    def _build_rotation_operator(self, angles):
+        """ Build the sparse rotation interpolation operator.
+
+        Parameters
+        ----------
+        angles: 3-uplet
+            the rotation angles in degrees for each axis (Euler
+            representation).
+
+        Returns
+        -------
+        operator: csr_matrix (N, N)
+            the rotation operator.
+        """
+        interp_coefs = self.find_interpol_coefs_cached(
+            self.vertices, self.triangles, angles, self.interpolation)
+        neighs, weights = interp_coefs["neighs"], interp_coefs["weights"]
+        n_vertices, n_neighs = neighs.shape
+        rows = np.repeat(np.arange(n_vertices), n_neighs)
+        return sparse.csr_matrix(
+            (weights.ravel(), (rows, neighs.ravel())),
+            shape=(n_vertices, n_vertices))
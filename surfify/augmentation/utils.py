@@ -15,9 +15,17 @@ A module with common augmentation utility functions.
 import abc
 import numbers
 import numpy as np
+import torch
 from collections import namedtuple
 
 
+# Sparse tensors are built from canonical scipy matrices: invariants checks
+# are skipped when available (torch >= 2.0)
+_SPARSE_KWARGS = (
+    {"check_invariants": False}
+    if hasattr(torch.sparse, "check_sparse_tensor_invariants") else {})
+
+
 class RandomAugmentation(object):
     """ Apply an augmentation with random parameters defined in intervals.
     """
@@ -28,6 +36,7 @@ class RandomAugmentation(object):
         """
         self.intervals = {}
         self.writable = True
+        self._sparse_tensor = None
 
     def _randomize(self):
         """ Update the random parameters.
@@ -59,25 +68,64 @@ class RandomAugmentation(object):
 
         Parameters
         ----------
-        data: array (N, )
+        data: array (N, ) or tensor (N, ), (B, N) or (B, C, N)
             input data/texture.
         inplace: bool, default False
             wether to copy or not the input data (pass as a kwargs).
 
         Returns
         -------
-        data: arr (N, )
+        data: arr (N, ) or tensor (N, ), (B, N) or (B, C, N)
             augmented input data.
         """
         self._randomize()
         if kwargs.get("inplace", True):
-            data = data.copy()
+            data = data.clone() if torch.is_tensor(data) else data.copy()
         return self.run(data, *args, **kwargs)
 
     @abc.abstractmethod
     def run(self, data):
         return
 
+    def _sparse_dot(self, operator, data):
+        """ Applies a sparse operator on the last axis of the data. On
+        tensors, the operator indices are cached and only its values are
+        copied at each call: the operator sparsity pattern must not change,
+        but its values can be updated in place.
+
+        Parameters
+        ----------
+        operator: csr_matrix (N, N)
+            the sparse operator.
+        data: array (N, ) or tensor (..., N)
+            input data/texture.
+
+        Returns
+        -------
+        data: arr (N, ) or tensor (..., N)
+            transformed input data.
+        """
+        if not torch.is_tensor(data):
+            return operator.dot(data)
+        if (self._sparse_tensor is None or
+                self._sparse_tensor[0] is not operator or
+                self._sparse_tensor[1].device != data.device):
+            operator.sum_duplicates()
+            rows = np.repeat(np.arange(operator.shape[0]),
+                             np.diff(operator.indptr))
+            indices = torch.from_numpy(
+                np.stack((rows, operator.indices))).long().to(data.device)
+            self._sparse_tensor = (operator, indices)
+        values = torch.from_numpy(operator.data).to(
+            device=data.device, dtype=data.dtype)
+        tensor = torch.sparse_coo_tensor(
+            self._sparse_tensor[1], values, size=operator.shape,
+            **_SPARSE_KWARGS)._coalesced_(True)
+        shape = data.shape
+        data = data.reshape(-1, shape[-1]).T
+        data = torch.sparse.mm(tensor, data)
+        return data.T.reshape(shape)
+
 
 def interval(bound, dtype=float):
     """ Create an interval.
@@ -108,6 +156,10 @@ def interval(bound, dtype=float):
 
 class Transformer(object):
     """ Class that can be used to register a sequence of transformations.
+    When applied on a batch of tensors, each transformation is applied on
+    every sample with the registered probability, but the random parameters
+    drawn by a transformation (e.g. the blur sigma or the rotation angles)
+    are shared by the selected samples.
     """
     Transform = namedtuple("Transform", ["transform", "probability"])
 
@@ -134,14 +186,26 @@ class Transformer(object):
 
         Parameters
         ----------
-        data: array (N, ) or (n_channels, N)
+        data: array (N, ) or (n_channels, N) or tensor (B, C, N)
             the input data.
 
         Returns
         -------
-        _data: array (N, ) or (n_channels, N)
+        _data: array (N, ) or (n_channels, N) or tensor (B, C, N)
             the transformed input data.
         """
+        if torch.is_tensor(data):
+            _data = data.clone()
+            for trf in self.transforms:
+                selected = np.random.rand(len(_data)) < trf.probability
+                if selected.all():
+                    _data = trf.transform(_data, *args, **kwargs)
+                elif selected.any():
+                    indices = torch.from_numpy(
+                        np.flatnonzero(selected)).to(_data.device)
+                    _data[indices] = trf.transform(
+                        _data[indices], *args, **kwargs)
+            return _data
         ndim = data.ndim
         assert ndim in (1, 2)
         _data = data.copy()
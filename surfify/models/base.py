@@ -91,6 +91,27 @@ class SphericalBase(nn.Module):
             input_order, n_layers, conv_mode, dine_size, repa_size, repa_zoom,
             dynamic_repa_zoom, standard_ico, cachedir)
 
+    def _apply(self, fn, *args, **kwargs):
+        """ Apply a conversion to the module tensors: index tables shared by
+        several layers are converted only once, so that layers working at
+        the same order keep sharing the same indices, ie. on the GPU.
+        Tensors without storage (ie. on the meta device) are not shared,
+        since their data pointers are all null.
+        """
+        converted = {}
+
+        def _fn(tensor):
+            if (tensor.is_floating_point() or tensor.is_complex() or
+                    tensor.device.type == "meta" or tensor.data_ptr() == 0):
+                return fn(tensor)
+            key = (tensor.data_ptr(), tensor.dtype, tensor.device,
+                   tuple(tensor.shape), tensor.stride())
+            if key not in converted:
+                converted[key] = fn(tensor)
+            return converted[key]
+
+        return super(SphericalBase, self)._apply(_fn, *args, **kwargs)
+
     def _safe_forward(self, block, x, act=None, skip_last_act=False):
         """ Perform a safe forward pass on a specific input block.
         """
@@ -160,7 +181,7 @@ class SphericalBase(nn.Module):
                 order, vertices.shape, triangles.shape))
             neighs = neighbors_cached(
                 vertices, triangles, depth=1, direct_neighbor=True)
-            neighs = np.asarray(list(neighs.values()))
+            neighs = np.asarray(list(neighs.values()), dtype=np.int32)
             logger.debug("- neighbors {0}: {1}".format(order, neighs.shape))
             if conv_mode == "DiNe":
                 if dine_size == 1:
@@ -169,7 +190,8 @@ class SphericalBase(nn.Module):
                     conv_neighs = neighbors_cached(
                         vertices, triangles, depth=dine_size,
                         direct_neighbor=True)
-                    conv_neighs = np.asarray(list(conv_neighs.values()))
+                    conv_neighs = np.asarray(
+                        list(conv_neighs.values()), dtype=np.int32)
                 logger.debug("- conv neighbors {0}: {1}".format(
                     order, conv_neighs.shape))
             elif conv_mode == "RePa":
@@ -183,7 +205,8 @@ class SphericalBase(nn.Module):
                 logger.debug("- conv neighbors {0} - {1}: {2} - {3}".format(
                     order, current_zoom, conv_neighs.shape,
                     conv_weights.shape))
-                conv_neighs = (conv_neighs, conv_weights)
+                conv_neighs = (conv_neighs.astype(np.int32, copy=False),
+                               conv_weights)
             else:
                 raise ValueError("Unexptected convolution mode.")
             ico[order] = cls.Ico(
@@ -194,7 +217,8 @@ class SphericalBase(nn.Module):
         for order in range(
                 input_order, input_order - n_layers, -1):
             down_indices = downsample_cached(
-                ico[order].vertices, ico[order - 1].vertices)
+                ico[order].vertices, ico[order - 1].vertices).astype(
+                    np.int32, copy=False)
             logger.debug("- down {0}: {1}".format(order, down_indices.shape))
             ico[order] = ico[order]._replace(
                 down_indices=down_indices)
@@ -203,7 +227,7 @@ class SphericalBase(nn.Module):
             up_indices = interpolate_cached(
                 ico[order].vertices, ico[order + 1].vertices,
                 ico[order + 1].triangles)
-            up_indices = np.asarray(list(up_indices.values()))
+            up_indices = np.asarray(list(up_indices.values()), dtype=np.int32)
             logger.debug("- up {0}: {1}".format(order, up_indices.shape))
             ico[order] = ico[order]._replace(
                 up_indices=up_indices)
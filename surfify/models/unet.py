@@ -12,6 +12,8 @@ The spherical UNet architecture.
 """
 
 # Imports
+import logging
+import functools
 import numpy as np
 import torch
 import torch.nn as nn
@@ -19,7 +21,8 @@ from joblib import Memory
 from ..utils import number_of_ico_vertices, get_logger, debug_msg
 from ..nn import (
     IcoUpConv, IcoMaxIndexUpSample, IcoFixIndexUpSample, IcoUpSample, IcoPool,
-    IcoSpMaConv, IcoSpMaConvTranspose)
+    IcoSpMaConv, IcoSpMaConvTranspose, IcoDiNeConv)
+from ..nn.functional import batch_norm_leaky_relu
 from .base import SphericalBase
 
 
@@ -74,7 +77,8 @@ class SphericalUNet(SphericalBase):
     def __init__(self, in_order, in_channels, out_channels, depth=5,
                  start_filts=32, conv_mode="DiNe", dine_size=1, repa_size=5,
                  repa_zoom=5, dynamic_repa_zoom=False, up_mode="interp",
-                 standard_ico=False, cachedir=None):
+                 standard_ico=False, cachedir=None, fuse_bn_act=False,
+                 compile_forward=False):
         """ Init SphericalUNet.
 
         Parameters
@@ -112,6 +116,12 @@ class SphericalUNet(SphericalBase):
             optionaly use surfify tesselation.
         cachedir: str, default None
             set this folder to use smart caching speedup.
+        fuse_bn_act: bool, default False
+            optionally fuse each batch normalization with the following
+            activation in a single compiled kernel.
+        compile_forward: bool, default False
+            optionally compile the forward pass for static input shapes
+            (requires torch >= 2.0).
         """
         logger.debug("SphericalUNet init...")
         super(SphericalUNet, self).__init__(
@@ -126,6 +136,7 @@ class SphericalUNet(SphericalBase):
         self.in_channels = in_channels
         self.out_channels = out_channels
         self.up_mode = up_mode
+        self.fuse_bn_act = fuse_bn_act
         self.filts = [in_channels] + [
             start_filts * 2 ** idx for idx in range(depth)]
         logger.debug("- filters: {0}".format(self.filts))
@@ -152,7 +163,8 @@ class SphericalUNet(SphericalBase):
                     None if idx == 0
                     else self.ico[order + 1].down_indices),
                 pool_mode=("max" if self.up_mode == "maxpad" else "mean"),
-                first=(True if idx == 0 else False))
+                first=(True if idx == 0 else False),
+                fuse_bn_act=self.fuse_bn_act)
             setattr(self, "down{0}".format(idx + 1), block)
 
         cnt = 1
@@ -169,20 +181,34 @@ class SphericalUNet(SphericalBase):
                 neigh_indices=self.ico[order + 1].neighbor_indices,
                 up_neigh_indices=self.ico[order].up_indices,
                 down_indices=self.ico[order + 1].down_indices,
-                up_mode=self.up_mode)
+                up_mode=self.up_mode,
+                fuse_bn_act=self.fuse_bn_act)
             setattr(self, "up{0}".format(cnt), block)
             order += 1
             cnt += 1
 
         logger.debug("- FC: {0} -> {1}".format(self.filts[1], out_channels))
-        self.fc = nn.Sequential(
-            nn.Linear(self.filts[1], out_channels))
+        self.fc = nn.Conv1d(self.filts[1], out_channels, kernel_size=1)
+
+        if compile_forward and not hasattr(torch, "compile"):
+            raise ValueError(
+                "Compiling the forward pass requires torch >= 2.0.")
+        self.compile_forward = compile_forward
 
     def forward(self, x):
         """ Forward method.
         """
-        logger.debug("SphericalUNet...")
-        logger.debug(debug_msg("input", x))
+        if self.compile_forward:
+            return _compiled_unet_forward()(self, x)
+        return self._forward(x)
+
+    def _forward(self, x):
+        """ Eager forward method.
+        """
+        debug = logger.isEnabledFor(logging.DEBUG)
+        if debug:
+            logger.debug("SphericalUNet...")
+            logger.debug(debug_msg("input", x))
         if x.size(2) != self.in_vertices:
             raise RuntimeError("Input data must be projected on an {0} order "
                                "icosahedron.".format(self.in_order))
@@ -190,7 +216,8 @@ class SphericalUNet(SphericalBase):
         pooling_outs = []
         for idx in range(1, self.depth + 1):
             down_block = getattr(self, "down{0}".format(idx))
-            logger.debug("- filter {0}: {1}".format(idx, down_block))
+            if debug:
+                logger.debug("- filter {0}: {1}".format(idx, down_block))
             x, max_pool_indices = down_block(x)
             encoder_outs.append(x)
             pooling_outs.append(max_pool_indices)
@@ -198,21 +225,33 @@ class SphericalUNet(SphericalBase):
         pooling_outs = pooling_outs[::-1]
         for idx in range(1, self.depth):
             up_block = getattr(self, "up{0}".format(idx))
-            logger.debug("- filter {0}: {1}".format(idx, up_block))
+            if debug:
+                logger.debug("- filter {0}: {1}".format(idx, up_block))
             x_up = encoder_outs[idx]
             max_pool_indices = pooling_outs[idx - 1]
             x = up_block(x, x_up, max_pool_indices)
-        logger.debug("FC...")
-        logger.debug(debug_msg("input", x))
-        n_samples = len(x)
-        x = x.permute(0, 2, 1)
-        x = x.reshape(n_samples * self.in_vertices, self.filts[1])
+        if debug:
+            logger.debug("FC...")
+            logger.debug(debug_msg("input", x))
         x = self.fc(x)
-        x = x.view(n_samples, self.in_vertices, self.out_channels)
-        x = x.permute(0, 2, 1)
-        logger.debug(debug_msg("output", x))
+        if debug:
+            logger.debug(debug_msg("output", x))
         return x
 
+    def _load_from_state_dict(self, state_dict, prefix, *args, **kwargs):
+        """ Convert the legacy vertex-wise linear layer parameters to the
+        equivalent 1x1 convolution parameters.
+        """
+        for name in ("weight", "bias"):
+            key = prefix + "fc.0." + name
+            if key in state_dict:
+                param = state_dict.pop(key)
+                if name == "weight":
+                    param = param[..., None]
+                state_dict[prefix + "fc." + name] = param
+        super(SphericalUNet, self)._load_from_state_dict(
+            state_dict, prefix, *args, **kwargs)
+
 
 class DownBlock(nn.Module):
     """ Downsampling block in spherical UNet:
@@ -220,7 +259,7 @@ class DownBlock(nn.Module):
     """
     def __init__(self, conv_layer, in_ch, out_ch, conv_neigh_indices,
                  down_neigh_indices, down_indices, pool_mode="mean",
-                 first=False):
+                 first=False, fuse_bn_act=False):
         """ Init DownBlock.
 
         Parameters
@@ -241,6 +280,9 @@ class DownBlock(nn.Module):
             the pooling mode: 'mean' or 'max'.
         first: bool, default False
             if set skip the pooling block.
+        fuse_bn_act: bool, default False
+            optionally fuse each batch normalization with the following
+            activation in a single compiled kernel.
         """
         super(DownBlock, self).__init__()
         self.first = first
@@ -256,21 +298,26 @@ class DownBlock(nn.Module):
             nn.BatchNorm1d(out_ch, momentum=0.15, affine=True,
                            track_running_stats=False),
             nn.LeakyReLU(0.2, inplace=True))
+        self.bn_act = _compiled_bn_act() if fuse_bn_act else None
 
     def forward(self, x):
         """ Forward method.
         """
-        logger.debug("- DownBlock")
-        logger.debug(debug_msg("input", x))
+        debug = logger.isEnabledFor(logging.DEBUG)
+        if debug:
+            logger.debug("- DownBlock")
+            logger.debug(debug_msg("input", x))
         max_pool_indices = None
         if not self.first:
             x, max_pool_indices = self.pooling(x)
-            logger.debug(debug_msg("pooling", x))
-            if max_pool_indices is not None:
-                logger.debug(debug_msg("max pooling indices",
-                                       max_pool_indices))
-        x = self.double_conv(x)
-        logger.debug(debug_msg("output", x))
+            if debug:
+                logger.debug(debug_msg("pooling", x))
+                if max_pool_indices is not None:
+                    logger.debug(debug_msg("max pooling indices",
+                                           max_pool_indices))
+        x = _double_conv_forward(self.double_conv, x, self.bn_act)
+        if debug:
+            logger.debug(debug_msg("output", x))
         return x, max_pool_indices
 
 
@@ -279,7 +326,8 @@ class UpBlock(nn.Module):
     upconv => (conv => BN => ReLU) * 2
     """
     def __init__(self, conv_layer, in_ch, out_ch, conv_neigh_indices,
-                 neigh_indices, up_neigh_indices, down_indices, up_mode):
+                 neigh_indices, up_neigh_indices, down_indices, up_mode,
+                 fuse_bn_act=False):
         """ Init UpBlock.
 
         Parameters
@@ -303,6 +351,9 @@ class UpBlock(nn.Module):
             convolution, 'interp' for nearest neighbor linear interpolation,
             'maxpad' for max pooling shifted zero padding, and 'zeropad' for
             classical zero padding.
+        fuse_bn_act: bool, default False
+            optionally fuse each batch normalization with the following
+            activation in a single compiled kernel.
         """
         super(UpBlock, self).__init__()
         self.up_mode = up_mode
@@ -327,25 +378,64 @@ class UpBlock(nn.Module):
              nn.BatchNorm1d(out_ch, momentum=0.15, affine=True,
                             track_running_stats=False),
              nn.LeakyReLU(0.2, inplace=True))
+        self.bn_act = _compiled_bn_act() if fuse_bn_act else None
 
     def forward(self, x1, x2, max_pool_indices):
         """ Forward method.
         """
-        logger.debug("- UpBlock")
-        logger.debug(debug_msg("input", x1))
-        logger.debug(debug_msg("skip", x2))
+        debug = logger.isEnabledFor(logging.DEBUG)
+        if debug:
+            logger.debug("- UpBlock")
+            logger.debug(debug_msg("input", x1))
+            logger.debug(debug_msg("skip", x2))
         if self.up_mode == "maxpad":
             x1 = self.up(x1, max_pool_indices)
         else:
             x1 = self.up(x1)
-        logger.debug(debug_msg("upsampling", x1))
-        x = torch.cat((x1, x2), 1)
-        logger.debug(debug_msg("cat", x))
-        x = self.double_conv(x)
-        logger.debug(debug_msg("output", x))
+        if debug:
+            logger.debug(debug_msg("upsampling", x1))
+        if isinstance(self.double_conv[0], IcoDiNeConv):
+            x = [x1, x2]
+        else:
+            x = torch.cat((x1, x2), 1)
+            if debug:
+                logger.debug(debug_msg("cat", x))
+        x = _double_conv_forward(self.double_conv, x, self.bn_act)
+        if debug:
+            logger.debug(debug_msg("output", x))
         return x
 
 
+@functools.lru_cache(maxsize=None)
+def _compiled_bn_act():
+    """ Compile the fused batch normalization and leaky ReLU function.
+    """
+    if hasattr(torch, "compile"):
+        return torch.compile(batch_norm_leaky_relu)
+    return torch.jit.script(batch_norm_leaky_relu)
+
+
+@functools.lru_cache(maxsize=None)
+def _compiled_unet_forward():
+    """ Compile the SphericalUNet forward function. The unbound function is
+    compiled so that copied models run with their own weights.
+    """
+    return torch.compile(SphericalUNet._forward, dynamic=False)
+
+
+def _double_conv_forward(double_conv, x, bn_act=None):
+    """ Forward a (conv => BN => ReLU) * 2 block, optionally calling the
+    provided fused batch normalization and activation function.
+    """
+    if bn_act is None:
+        return double_conv(x)
+    for idx in range(0, len(double_conv), 3):
+        conv, norm, act = double_conv[idx: idx + 3]
+        x = bn_act(conv(x), norm.weight, norm.bias, norm.eps,
+                   act.negative_slope)
+    return x
+
+
 class SphericalGUNet(nn.Module):
     """ The Spherical Grided U-Net architecture.
 
@@ -12,6 +12,7 @@ Suface utilities.
 """
 
 # Imports
+import torch
 import torch.nn.functional as F
 
 
@@ -35,3 +36,31 @@ def circular_pad(x, pad):
     x = F.pad(x, (pad[1], pad[1], 0, 0), "constant", 0)
     x = F.pad(x, (0, 0, pad[0], pad[0]), "circular")
     return x
+
+
+def batch_norm_leaky_relu(x, weight, bias, eps: float = 1e-5,
+                          negative_slope: float = 0.01):
+    """ Batch normalization followed by a leaky ReLU activation.
+
+    The normalization always uses the current batch statistics, ie. it
+    matches a `BatchNorm1d` layer with `track_running_stats=False` followed
+    by a `LeakyReLU` layer. Compile this function to fuse the element-wise
+    operations into a single kernel.
+
+    Parameters
+    ----------
+    x: Tensor (samples, channels, vertices)
+        input tensor.
+    weight: Tensor (channels, )
+        the normalization scale.
+    bias: Tensor (channels, )
+        the normalization shift.
+    eps: float, default 1e-5
+        a value added to the denominator for numerical stability.
+    negative_slope: float, default 0.01
+        the activation negative slope.
+    """
+    var, mean = torch.var_mean(x, dim=[0, 2], unbiased=False, keepdim=True)
+    x = (x - mean) * torch.rsqrt(var + eps)
+    x = x * weight[:, None] + bias[:, None]
+    return F.leaky_relu(x, negative_slope)
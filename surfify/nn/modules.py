@@ -16,6 +16,7 @@ import logging
 import collections
 import torch
 import torch.nn as nn
+import torch.nn.functional as F
 import numpy as np
 from ..utils import get_logger, debug_msg
 from .functional import circular_pad
@@ -197,18 +198,22 @@ class IcoRePaConv(nn.Module):
         super(IcoRePaConv, self).__init__()
         self.in_feats = in_feats
         self.out_feats = out_feats
-        self.neigh_indices, self.neigh_weights = neighs
-        self.n_vertices, self.neigh_size, _ = self.neigh_indices.shape
-        self.neigh_indices = self.neigh_indices.reshape(self.n_vertices, -1)
-        self.neigh_weights = torch.from_numpy(
-            self.neigh_weights.reshape(self.n_vertices, -1).astype(np.float32))
+        neigh_indices, neigh_weights = neighs
+        self.n_vertices, self.neigh_size, _ = neigh_indices.shape
+        self.register_buffer(
+            "neigh_indices", torch.as_tensor(
+                neigh_indices.reshape(self.n_vertices, -1),
+                dtype=torch.int32),
+            persistent=False)
+        self.register_buffer(
+            "neigh_weights", torch.from_numpy(
+                neigh_weights.reshape(self.n_vertices, -1).astype(
+                    np.float32)),
+            persistent=False)
         self.weight = nn.Linear(self.neigh_size * in_feats, out_feats)
 
     def forward(self, x):
         logger.debug("IcoRePaConv...")
-        device = x.get_device()
-        if self.neigh_weights.get_device() != device:
-            self.neigh_weights = self.neigh_weights.to(device)
         logger.debug(debug_msg("input", x))
         logger.debug("  weight: {0}".format(self.weight))
         logger.debug("  neighbors indices: {0}".format(
@@ -216,7 +221,7 @@ class IcoRePaConv(nn.Module):
         logger.debug("  neighbors weights: {0}".format(
             self.neigh_weights.shape))
         n_samples = len(x)
-        mat = x[:, :, self.neigh_indices.reshape(-1)].view(
+        mat = x.index_select(2, self.neigh_indices.reshape(-1)).view(
             n_samples, self.in_feats, self.n_vertices, self.neigh_size * 3)
         logger.debug(debug_msg("neighors", mat))
         x = torch.mul(mat, self.neigh_weights).view(
@@ -280,24 +285,80 @@ class IcoDiNeConv(nn.Module):
         super(IcoDiNeConv, self).__init__()
         self.in_feats = in_feats
         self.out_feats = out_feats
-        self.neigh_indices = neigh_indices
+        self.register_buffer(
+            "neigh_indices", torch.as_tensor(neigh_indices, dtype=torch.int32),
+            persistent=False)
         self.n_vertices, self.neigh_size = neigh_indices.shape
         self.weight = nn.Linear(self.neigh_size * in_feats, out_feats,
                                 bias=bias)
 
     def forward(self, x):
         """ Forward method.
+
+        Parameters
+        ----------
+        x: Tensor (samples, in_feats, N) or list of Tensor
+            input tensor. A list of tensors is processed as its channel-wise
+            concatenation without allocating the concatenated tensor: the
+            tensors' features must add up to in_feats.
+        """
+        return self.project(self.gather(x))
+
+    def gather(self, x):
+        """ Gather the vertices neighborhoods in a channels last layout, ie.
+        each vertex neighborhood is read as contiguous feature vectors.
+
+        Parameters
+        ----------
+        x: Tensor (samples, feats, N) or list of Tensor
+            input tensor.
+
+        Returns
+        -------
+        x_neigh: list of Tensor (samples * N, k * feats)
+            the flatten neighborhoods of each input tensor.
         """
-        mat = x[:, :, self.neigh_indices.reshape(-1)].view(
-            len(x), self.in_feats, self.n_vertices, self.neigh_size)
-        mat = mat.permute(0, 2, 1, 3)
-        mat = mat.reshape(len(x) * self.n_vertices,
-                          self.in_feats * self.neigh_size)
-        out_features = self.weight(mat)
-        out_features = out_features.view(len(x), self.n_vertices,
-                                         self.out_feats)
-        out_features = out_features.permute(0, 2, 1)
-        return out_features
+        if torch.is_tensor(x):
+            x = [x]
+        indices = self.neigh_indices.reshape(-1)
+        x_neigh = []
+        for _x in x:
+            n_samples, n_feats, _ = _x.size()
+            mat = _x.transpose(1, 2).index_select(1, indices)
+            x_neigh.append(mat.view(n_samples * self.n_vertices,
+                                    self.neigh_size * n_feats))
+        return x_neigh
+
+    def project(self, x_neigh):
+        """ Apply the filters on gathered neighborhoods.
+
+        Parameters
+        ----------
+        x_neigh: list of Tensor (samples * N, k * feats)
+            the flatten neighborhoods as returned by the 'gather' method.
+
+        Returns
+        -------
+        out: Tensor (samples, out_feats, N)
+            output tensor.
+        """
+        n_neigh_feats = sum(mat.size(1) for mat in x_neigh)
+        if n_neigh_feats != self.in_feats * self.neigh_size:
+            raise ValueError(
+                "Expected {0} input features, got {1}.".format(
+                    self.in_feats, n_neigh_feats // self.neigh_size))
+        out_features, bias, stop = None, self.weight.bias, 0
+        for mat in x_neigh:
+            n_feats = mat.size(1) // self.neigh_size
+            start, stop = stop, stop + n_feats * self.neigh_size
+            weight = self.weight.weight[:, start: stop].reshape(
+                self.out_feats, n_feats, self.neigh_size).transpose(1, 2)
+            _out = F.linear(mat, weight.reshape(self.out_feats, -1), bias)
+            out_features = (
+                _out if out_features is None else out_features + _out)
+            bias = None
+        out_features = out_features.view(-1, self.n_vertices, self.out_feats)
+        return out_features.permute(0, 2, 1)
 
 
 class IcoPool(nn.Module):
@@ -340,7 +401,11 @@ class IcoPool(nn.Module):
         """
         super(IcoPool, self).__init__()
         self.down_indices = down_indices
-        self.down_neigh_indices = down_neigh_indices[down_indices]
+        self.register_buffer(
+            "down_neigh_indices",
+            torch.as_tensor(down_neigh_indices[down_indices],
+                            dtype=torch.int32),
+            persistent=False)
         self.n_vertices, self.neigh_size = self.down_neigh_indices.shape
         self.pooling_type = pooling_type
 
@@ -354,7 +419,7 @@ class IcoPool(nn.Module):
         n_features = x.size(1)
         logger.debug("  down neighbors indices: {0}".format(
             self.down_neigh_indices.shape))
-        x = x[:, :, self.down_neigh_indices.reshape(-1)].view(
+        x = x.index_select(2, self.down_neigh_indices.reshape(-1)).view(
             len(x), n_features, n_vertices, self.neigh_size)
         logger.debug(debug_msg("neighors", x))
         if self.pooling_type == "mean":
@@ -438,11 +503,21 @@ class IcoUpConv(nn.Module):
         self.sorted_2occ_neigh_indices = self.sorted_neigh_indices[
             len(down_indices) + 12:]
         self._check_occurence(self.sorted_2occ_neigh_indices, occ=2)
-        self.argsort_2occ_12neigh_indices = self.argsort_neigh_indices[:24]
-        self.argsort_1occ_neigh_indices = self.argsort_neigh_indices[
-            24: len(down_indices) + 12]
-        self.argsort_2occ_neigh_indices = self.argsort_neigh_indices[
-            len(down_indices) + 12:]
+        self.register_buffer(
+            "argsort_2occ_12neigh_indices",
+            torch.as_tensor(self.argsort_neigh_indices[:24],
+                            dtype=torch.int32),
+            persistent=False)
+        self.register_buffer(
+            "argsort_1occ_neigh_indices",
+            torch.as_tensor(self.argsort_neigh_indices[
+                24: len(down_indices) + 12], dtype=torch.int32),
+            persistent=False)
+        self.register_buffer(
+            "argsort_2occ_neigh_indices",
+            torch.as_tensor(self.argsort_neigh_indices[
+                len(down_indices) + 12:], dtype=torch.int32),
+            persistent=False)
 
         self.weight = nn.Linear(in_feats, self.neigh_size * out_feats)
 
@@ -469,12 +544,12 @@ class IcoUpConv(nn.Module):
         x = x.view(n_samples, n_vertices, self.neigh_size, self.out_feats)
         logger.debug(debug_msg("weighted input", x))
         x = x.view(n_samples, n_vertices * self.neigh_size, self.out_feats)
-        x1 = x[:, self.argsort_2occ_12neigh_indices]
+        x1 = x.index_select(1, self.argsort_2occ_12neigh_indices)
         x1 = x1.view(n_samples, 12, 2, self.out_feats)
         logger.debug(debug_msg("12 first 2 occ output", x1))
-        x2 = x[:, self.argsort_1occ_neigh_indices]
+        x2 = x.index_select(1, self.argsort_1occ_neigh_indices)
         logger.debug(debug_msg("1 occ output", x2))
-        x3 = x[:, self.argsort_2occ_neigh_indices]
+        x3 = x.index_select(1, self.argsort_2occ_neigh_indices)
         x3 = x3.view(n_samples, -1, 2, self.out_feats)
         logger.debug(debug_msg("2 occ output", x3))
         x = torch.cat(
@@ -628,7 +703,10 @@ class IcoUpSample(nn.Module):
             upsampling neighborhood indices.
         """
         super(IcoUpSample, self).__init__()
-        self.up_neigh_indices = up_neigh_indices
+        self.register_buffer(
+            "up_neigh_indices",
+            torch.as_tensor(up_neigh_indices, dtype=torch.int32),
+            persistent=False)
         self.n_vertices, self.neigh_size = up_neigh_indices.shape
         self.in_feats = in_feats
         self.out_feats = out_feats
@@ -644,7 +722,7 @@ class IcoUpSample(nn.Module):
         n_features = x.size(1)
         logger.debug("  up neighbors indices: {0}".format(
             self.up_neigh_indices.shape))
-        x = x[:, :, self.up_neigh_indices.reshape(-1)].view(
+        x = x.index_select(2, self.up_neigh_indices.reshape(-1)).view(
             len(x), n_features, n_vertices, self.neigh_size)
         logger.debug(debug_msg("neighbors", x))
         x = torch.mean(x, dim=-1)
@@ -702,15 +780,21 @@ class IcoFixIndexUpSample(nn.Module):
             upsampling neighborhood indices.
         """
         super(IcoFixIndexUpSample, self).__init__()
-        self.up_neigh_indices = up_neigh_indices
+        self.register_buffer(
+            "up_neigh_indices",
+            torch.as_tensor(up_neigh_indices, dtype=torch.int32),
+            persistent=False)
         self.n_vertices, self.neigh_size = up_neigh_indices.shape
         self.in_feats = in_feats
         self.out_feats = out_feats
         self.fc = nn.Linear(in_feats, out_feats)
-        self.new_indices = []
-        for idx, row in enumerate(self.up_neigh_indices):
+        new_indices = []
+        for idx, row in enumerate(up_neigh_indices):
             if len(np.unique(row)) > 1:
-                self.new_indices.append(idx)
+                new_indices.append(idx)
+        self.register_buffer(
+            "new_indices", torch.as_tensor(new_indices, dtype=torch.long),
+            persistent=False)
 
     def forward(self, x):
         """ Forward method.
@@ -722,7 +806,7 @@ class IcoFixIndexUpSample(nn.Module):
         n_features = x.size(1)
         logger.debug("  up neighbors indices: {0}".format(
             self.up_neigh_indices.shape))
-        x = x[:, :, self.up_neigh_indices[:, 0]]
+        x = x.index_select(2, self.up_neigh_indices[:, 0])
         logger.debug(debug_msg("neighbors", x))
         x[:, :, self.new_indices] = 0
         logger.debug(debug_msg("interp", x))
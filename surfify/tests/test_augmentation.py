@@ -10,6 +10,7 @@
 # Imports
 import os
 import numpy as np
+import torch
 import unittest
 import surfify.utils as utils
 import surfify.augmentation as augment
@@ -54,6 +55,24 @@ class TestAugmentation(unittest.TestCase):
         self.assertEqual(len(data), len(data_cut))
         self.assertTrue((data == data_cut).sum() < n_vertices)
 
+    def test_surf_cutout_patches(self):
+        """ Test SurfCutOut patches match the n-ring neighbors.
+        """
+        vertices, triangles = utils.icosahedron(order=3)
+        n_vertices = len(vertices)
+        data = np.zeros((n_vertices, ), dtype=int)
+        processor = augment.SurfCutOut(
+            vertices, triangles, neighs=None, patch_size=2, sigma=0,
+            n_patches=3, replacement_value=1)
+        np.random.seed(0)
+        data_cut = processor(data)
+        np.random.seed(0)
+        seeds = np.random.randint(0, n_vertices, 3)
+        expected = np.zeros((n_vertices, ), dtype=int)
+        for node in seeds:
+            expected[utils.find_neighbors(node, 2, processor.neighs)] = 1
+        self.assertTrue(np.array_equal(data_cut, expected))
+
     def test_surf_noise(self):
         """ Test SurfNoise.
         """
@@ -64,6 +83,10 @@ class TestAugmentation(unittest.TestCase):
         data_noise = processor(data)
         self.assertEqual(len(data), len(data_noise))
         self.assertTrue((data == data_noise).sum() < n_vertices)
+        np.random.seed(0)
+        data_noise = processor(data)
+        np.random.seed(0)
+        self.assertTrue(np.array_equal(data_noise, processor(data)))
 
     def test_surf_blur(self):
         """ Test SurfBlur.
@@ -77,6 +100,63 @@ class TestAugmentation(unittest.TestCase):
         self.assertEqual(len(data), len(data_blur))
         self.assertTrue((data == data_blur).sum() < n_vertices)
 
+    def test_surf_blur_interval(self):
+        """ Test SurfBlur with a sigma drawn at each call.
+        """
+        vertices, triangles = utils.icosahedron(order=3)
+        data = np.random.uniform(0, 1, len(vertices))
+        processor = augment.SurfBlur(
+            vertices, triangles, sigma=augment.interval((0.5, 2), float))
+        self.assertIsNone(processor.blur_operator)
+        for _ in range(3):
+            data_blur = processor(data)
+            expected = (processor.gaussian_kernel *
+                        data[processor.neighs]).sum(axis=1)
+            self.assertTrue(np.allclose(data_blur, expected))
+            data_blur = processor(torch.from_numpy(data))
+            expected = (processor.gaussian_kernel *
+                        data[processor.neighs]).sum(axis=1)
+            self.assertTrue(np.allclose(data_blur.numpy(), expected))
+
+    def test_surf_batch(self):
+        """ Test augmentations on a batch of tensors.
+        """
+        vertices, triangles = utils.icosahedron(order=3)
+        n_vertices = len(vertices)
+        data = torch.rand(4, 2, n_vertices)
+        for processor in (
+                augment.SurfCutOut(vertices, triangles, patch_size=2,
+                                   replacement_value=5),
+                augment.SurfNoise(sigma=3),
+                augment.SurfBlur(vertices, triangles, sigma=2),
+                augment.SurfRotation(vertices, triangles, phi=10)):
+            data_aug = processor(data)
+            self.assertEqual(data.shape, data_aug.shape)
+            self.assertTrue((data == data_aug).sum() < data.numel())
+            if isinstance(processor, (augment.SurfBlur,
+                                      augment.SurfRotation)):
+                sample = processor.run(data[1, 0].double().numpy())
+                self.assertTrue(np.allclose(
+                    data_aug[1, 0].numpy(), sample, atol=1e-5))
+            if isinstance(processor, augment.SurfBlur):
+                self.assertTrue(torch.allclose(
+                    data_aug, processor._gather_blur(data), atol=1e-5))
+
+    def test_transformer_batch(self):
+        """ Test Transformer draws the transformations per sample.
+        """
+        vertices, _ = utils.icosahedron(order=3)
+        data = torch.rand(32, 2, len(vertices))
+        transformer = augment.Transformer()
+        transformer.register(augment.SurfNoise(sigma=3), probability=0.5)
+        np.random.seed(0)
+        data_aug = transformer(data)
+        unchanged = (data == data_aug).flatten(1).all(dim=1)
+        np.random.seed(0)
+        selected = np.random.rand(len(data)) < 0.5
+        self.assertTrue(np.array_equal(unchanged.numpy(), ~selected))
+        self.assertTrue(0 < selected.sum() < len(data))
+
     def test_hemi_mixup(self):
         """ Test SurfBlur.
         """
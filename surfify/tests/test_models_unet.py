@@ -8,6 +8,7 @@
 ##########################################################################
 
 # Imports
+import copy
 import unittest
 import numpy as np
 import torch
@@ -67,6 +68,75 @@ class TestModelsUNet(unittest.TestCase):
                 dine_size=1, up_mode=up_mode, standard_ico=True)
             out = model(self.X)
 
+    def test_fuse_bn_act(self):
+        """ Test SphericalUNet fused batch normalization and activation.
+        """
+        params = dict(
+            in_order=self.order, in_channels=self.n_classes,
+            out_channels=self.n_classes, depth=self.depth,
+            start_filts=self.start_filts, conv_mode="DiNe", dine_size=1,
+            up_mode="interp", standard_ico=True)
+        model = models.SphericalUNet(**params)
+        fused_model = models.SphericalUNet(fuse_bn_act=True, **params)
+        fused_model.load_state_dict(model.state_dict())
+        X = self.X.float()
+        with torch.no_grad():
+            self.assertTrue(torch.allclose(
+                model(X), fused_model(X), atol=1e-4))
+
+    def test_compile_forward(self):
+        """ Test SphericalUNet compiled forward.
+        """
+        params = dict(
+            in_order=self.order, in_channels=self.n_classes,
+            out_channels=self.n_classes, depth=self.depth,
+            start_filts=self.start_filts, conv_mode="DiNe", dine_size=1,
+            up_mode="interp", standard_ico=True)
+        model = models.SphericalUNet(**params)
+        compiled_model = models.SphericalUNet(compile_forward=True, **params)
+        compiled_model.load_state_dict(model.state_dict())
+        X = self.X.float()
+        with torch.no_grad():
+            self.assertTrue(torch.allclose(
+                model(X), compiled_model(X), atol=1e-4))
+            copied_model = copy.deepcopy(compiled_model)
+            copied_model.fc.weight.zero_()
+            copied_model.fc.bias.fill_(7)
+            self.assertTrue(torch.allclose(
+                copied_model(X), torch.full_like(copied_model(X), 7)))
+            self.assertTrue(torch.allclose(
+                model(X), compiled_model(X), atol=1e-4))
+
+    def test_load_legacy_fc(self):
+        """ Test SphericalUNet loads legacy linear final layer weights.
+        """
+        model = models.SphericalUNet(
+            in_order=self.order, in_channels=self.n_classes,
+            out_channels=self.n_classes, depth=self.depth,
+            start_filts=self.start_filts, standard_ico=True)
+        state_dict = model.state_dict()
+        weight = state_dict.pop("fc.weight")
+        state_dict["fc.0.weight"] = weight[..., 0]
+        state_dict["fc.0.bias"] = state_dict.pop("fc.bias")
+        model.load_state_dict(state_dict)
+        self.assertTrue(torch.equal(model.fc.weight, weight))
+
+    def test_shared_indices(self):
+        """ Test SphericalUNet layers share their indices after a move.
+        """
+        model = models.SphericalUNet(
+            in_order=self.order, in_channels=self.n_classes,
+            out_channels=self.n_classes, depth=self.depth,
+            start_filts=self.start_filts, standard_ico=True)
+        model.to("meta")
+        self.assertEqual(model.down1.double_conv[0].neigh_indices.device,
+                         torch.device("meta"))
+        self.assertIs(model.down1.double_conv[0].neigh_indices,
+                      model.up1.double_conv[3].neigh_indices)
+        model.to_empty(device="cpu")
+        self.assertIsNot(model.down2.pooling.down_neigh_indices,
+                         model.down2.double_conv[0].neigh_indices)
+
 
 class TestModelsGUNet(unittest.TestCase):
     """ Test the SphericalGUNet.
@@ -121,6 +121,36 @@ class TestNNModules(unittest.TestCase):
         self.assertTrue(x.shape[1] == self.ico3_tensor.shape[1])
         self.assertTrue(x.shape[2] == len(self.ico3_vertices))
 
+    def test_dine_conv_split(self):
+        """ Test IcoDiNeConv module on a list of inputs.
+        """
+        module = nn.IcoDiNeConv(
+            in_feats=6, out_feats=4, neigh_indices=self.neighbor_indices)
+        x1 = torch.rand(10, 4, len(self.ico3_vertices))
+        x2 = torch.rand(10, 2, len(self.ico3_vertices))
+        x = module([x1, x2])
+        x_cat = module(torch.cat((x1, x2), dim=1))
+        self.assertTrue(torch.allclose(x, x_cat, atol=1e-5))
+        with self.assertRaises(ValueError):
+            module([x1, x2[:, :1]])
+        with self.assertRaises(ValueError):
+            module([x1, x2, x2])
+
+    def test_dine_conv_gather(self):
+        """ Test IcoDiNeConv gather and project steps.
+        """
+        module = nn.IcoDiNeConv(
+            in_feats=4, out_feats=4, neigh_indices=self.neighbor_indices)
+        n_samples, n_vertices = len(self.ico3_tensor), len(self.ico3_vertices)
+        mat = self.ico3_tensor[:, :, self.neighbor_indices.reshape(-1)]
+        mat = mat.view(n_samples, 4, n_vertices, -1).permute(0, 2, 1, 3)
+        expected = module.weight(mat.reshape(n_samples * n_vertices, -1))
+        expected = expected.view(n_samples, n_vertices, 4).permute(0, 2, 1)
+        x = module.project(module.gather(self.ico3_tensor))
+        self.assertTrue(torch.allclose(x, expected, atol=1e-5))
+        with self.assertRaises(ValueError):
+            module.project(module.gather(self.ico3_tensor[:, :3]))
+
     def test_repa_conv(self):
         """ Test IcoRePaConv module.
         """
@@ -407,7 +407,7 @@ def get_rectangular_projection(node, size=5, zoom=5):
 
 
 def find_neighbors(start_node, order, neighbors):
-    """ Recursively find neighbors from a starting node up to a certain order.
+    """ Iteratively find neighbors from a starting node up to a certain order.
 
     See Also
     --------
@@ -453,15 +453,15 @@ def find_neighbors(start_node, order, neighbors):
     indices: list of int
         the n-ring neighbors indices.
     """
-    indices = []
     if order <= 0:
         return [start_node]
-    for neigh in neighbors[start_node]:
-        if order == 1:
-            indices.append(neigh)
-        else:
-            indices += find_neighbors(neigh, order - 1, neighbors)
-    return list(set(indices))
+    indices = {start_node}
+    for _ in range(order):
+        ring_indices = set()
+        for node in indices:
+            ring_indices.update(neighbors[node])
+        indices = ring_indices
+    return list(indices)
 
 
 def build_freesurfer_ico(ico_file):